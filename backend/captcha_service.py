@@ -5,15 +5,50 @@ This module provides CAPTCHA verification using Google reCAPTCHA v2.
 """
 
 from typing import Optional
-import requests
+import asyncio
+import contextlib
+import httpx
+from tenacity import (
+    retry, retry_if_exception, stop_after_attempt, wait_exponential
+)
 from config import settings
 
+# Shared client: keeps TLS connections to Google alive between verifications
+captcha_client = httpx.AsyncClient(
+    http2=True,
+    timeout=5.0,
+    limits=httpx.Limits(max_keepalive_connections=20)
+)
+
+
+def _is_transient_error(error: BaseException) -> bool:
+    """Retry on network failures and 5xx responses only"""
+    if isinstance(error, httpx.TransportError):
+        return True
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return False
+
 
 class CaptchaService:
     """Handles CAPTCHA verification using Google reCAPTCHA v2"""
 
     RECAPTCHA_VERIFY_URL = "https://www.google.com/recaptcha/api/siteverify"
 
+    # Verifications arriving within this window are dispatched together
+    BATCH_WINDOW_SECONDS = 0.05
+    BATCH_MAX_SIZE = 50
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._inflight: set[asyncio.Task] = set()
+
+    def start(self) -> None:
+        """Start the background micro-batcher (call on application startup)"""
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self._run_batcher())
+
     def get_site_key(self) -> str:
         """
         Get the reCAPTCHA site key for frontend rendering.
@@ -22,7 +57,77 @@ class CaptchaService:
             raise ValueError("RECAPTCHA_SITE_KEY is not configured")
         return settings.RECAPTCHA_SITE_KEY
 
-    def verify_response(self, recaptcha_token: str, remote_ip: Optional[str] = None) -> bool:
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=0.1, max=1.0),
+        retry=retry_if_exception(_is_transient_error),
+        reraise=True
+    )
+    async def _post_verification(self, data: dict) -> dict:
+        """
+        POST to Google's siteverify endpoint, retrying transient failures.
+
+        Verification results (including `timeout-or-duplicate` error codes)
+        are returned as-is and never retried: a reCAPTCHA token can only
+        be verified once.
+        """
+        response = await captcha_client.post(
+            self.RECAPTCHA_VERIFY_URL,
+            data=data
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _run_batcher(self) -> None:
+        """
+        Collect pending verifications for one batch window, then fire them
+        concurrently over the shared connection pool.
+        """
+        while True:
+            batch = [await self._queue.get()]
+            try:
+                await asyncio.sleep(self.BATCH_WINDOW_SECONDS)
+            except asyncio.CancelledError:
+                self._fail_pending(batch)
+                raise
+            while len(batch) < self.BATCH_MAX_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            # Dispatch without awaiting so a slow batch does not hold up the next
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list[tuple[dict, asyncio.Future]]) -> None:
+        results = await asyncio.gather(
+            *(self._post_verification(data) for data, _ in batch),
+            return_exceptions=True
+        )
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    @staticmethod
+    def _fail_pending(batch: list[tuple[dict, asyncio.Future]]) -> None:
+        """Resolve waiting callers with an error (verify_response returns False)"""
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(httpx.TransportError("CAPTCHA service is shutting down"))
+
+    async def _verify(self, data: dict) -> dict:
+        """Queue a verification for the batcher, or send it directly if not running"""
+        if self._batcher is None:
+            return await self._post_verification(data)
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((data, future))
+        return await future
+
+    async def verify_response(self, recaptcha_token: str, remote_ip: Optional[str] = None) -> bool:
         """
         Verify reCAPTCHA token with Google's API.
 
@@ -45,23 +150,35 @@ class CaptchaService:
             if remote_ip:
                 data["remoteip"] = remote_ip
 
-            response = requests.post(
-                self.RECAPTCHA_VERIFY_URL,
-                data=data,
-                timeout=5
-            )
-            response.raise_for_status()
-            
-            result = response.json()
-            
+            result = await self._verify(data)
+
             # Check if verification was successful
             return result.get("success", False) is True
             
-        except (requests.RequestException, ValueError, KeyError) as e:
+        except (httpx.HTTPError, ValueError, KeyError) as e:
             # Log error in production
             print(f"reCAPTCHA verification error: {e}")
             return False
 
+    async def close(self) -> None:
+        """Stop the batcher and close the shared HTTP client (call on application shutdown)"""
+        if self._batcher is not None:
+            self._batcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._batcher
+            self._batcher = None
+
+            # Fail verifications still waiting for a batch window
+            pending = []
+            while not self._queue.empty():
+                pending.append(self._queue.get_nowait())
+            self._fail_pending(pending)
+
+        # Let dispatched batches finish before the client goes away
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+        await captcha_client.aclose()
+
 
 # Singleton instance
 captcha_service = CaptchaService()
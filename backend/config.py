@@ -1,5 +1,8 @@
+from functools import cached_property
+import os
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -10,6 +13,20 @@ class Settings(BaseSettings):
     DB_PASSWORD: str
     DB_NAME: str
 
+    # Connection pool settings. Every worker process has its own pool, so
+    # (pool size + overflow) * WEB_WORKERS must fit in DB_MAX_CONNECTIONS,
+    # which should stay below Postgres max_connections (default 100).
+    # Unset DB_POOL_SIZE / DB_MAX_OVERFLOW are derived from that budget.
+    DB_MAX_CONNECTIONS: int = Field(default=90, ge=1)
+    DB_POOL_SIZE: Optional[int] = None
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_RECYCLE: int = 3600  # seconds before a connection is replaced
+    DB_POOL_TIMEOUT: int = 5  # seconds to wait for a free connection
+
+    # Server settings (worker processes started by `python main.py`).
+    # Unset: one per CPU, capped at DB_MAX_CONNECTIONS.
+    WEB_WORKERS: Optional[int] = Field(default=None, ge=1)
+
     # Redis settings
     REDIS_HOST: str
     REDIS_PORT: int
@@ -31,6 +48,34 @@ class Settings(BaseSettings):
     RECAPTCHA_SITE_KEY: str
     RECAPTCHA_SECRET_KEY: str
 
+    @property
+    def web_workers(self) -> int:
+        if self.WEB_WORKERS is not None:
+            return self.WEB_WORKERS
+        return min(os.cpu_count() or 2, self.DB_MAX_CONNECTIONS)
+
+    @property
+    def db_pool_size(self) -> int:
+        if self.DB_POOL_SIZE is not None:
+            return self.DB_POOL_SIZE
+        return max(1, self.DB_MAX_CONNECTIONS // self.web_workers // 2)
+
+    @property
+    def db_max_overflow(self) -> int:
+        if self.DB_MAX_OVERFLOW is not None:
+            return self.DB_MAX_OVERFLOW
+        return max(0, self.DB_MAX_CONNECTIONS // self.web_workers - self.db_pool_size)
+
+    @model_validator(mode="after")
+    def check_connection_budget(self) -> "Settings":
+        total = (self.db_pool_size + self.db_max_overflow) * self.web_workers
+        if total > self.DB_MAX_CONNECTIONS:
+            raise ValueError(
+                f"(pool size + overflow) * WEB_WORKERS = {total} exceeds "
+                f"DB_MAX_CONNECTIONS ({self.DB_MAX_CONNECTIONS})"
+            )
+        return self
+
     @property
     def database_url(self) -> str:
         """Construct PostgreSQL database URL from components"""
@@ -40,12 +85,41 @@ class Settings(BaseSettings):
         )
 
     @property
+    def async_database_url(self) -> str:
+        """Construct asyncpg database URL used by the application"""
+        return (
+            f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}"
+            f"@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+        )
+
+    @cached_property
+    def allowed_origins_list(self) -> List[str]:
+        """Comma-separated ALLOWED_ORIGINS parsed into CORS origins"""
+        return [
+            origin.strip()
+            for origin in self.ALLOWED_ORIGINS.split(",")
+            if origin.strip()
+        ]
+
+    @cached_property
     def allowed_contestants_list(self) -> List[str]:
         return [
             name.strip().lower()
             for name in self.ALLOWED_CONTESTANTS.split(",")
         ]
 
+    @cached_property
+    def contestants_set(self) -> frozenset[str]:
+        """Normalized contestant names, computed once for O(1) lookups"""
+        return frozenset(self.allowed_contestants_list)
+
+    @cached_property
+    def invalid_contestant_message(self) -> str:
+        return (
+            "Invalid contestant name. Allowed contestants: "
+            f"{', '.join(self.allowed_contestants_list)}"
+        )
+
     class Config:
         env_file = ".env"  # Tells Pydantic to load from .env
 
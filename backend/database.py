@@ -1,19 +1,27 @@
 from sqlalchemy import (
-    create_engine, Column, String, Integer, DateTime, Boolean
+    create_engine, Column, String, Integer, DateTime, Boolean, UniqueConstraint,
+    Index, text
+)
+from sqlalchemy.ext.asyncio import (
+    create_async_engine, async_sessionmaker, AsyncSession
 )
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 from config import settings
 
-engine = create_engine(
-    settings.database_url,
+engine = create_async_engine(
+    settings.async_database_url,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_timeout=settings.DB_POOL_TIMEOUT
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False: async sessions cannot lazy-load expired attributes
+SessionLocal = async_sessionmaker(
+    engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 Base = declarative_base()
 
 
@@ -37,11 +45,17 @@ class VoteSession(Base):
 class Vote(Base):
     """Records individual votes"""
     __tablename__ = "votes"
+    __table_args__ = (
+        # Also serves (fingerprint, contestant) and fingerprint-only lookups
+        UniqueConstraint("fingerprint", "contestant", name="uq_vote_fp_contestant"),
+        # Recent-votes-per-fingerprint window
+        Index("ix_vote_fp_created", "fingerprint", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    fingerprint = Column(String, index=True, nullable=False)
+    fingerprint = Column(String, nullable=False)
     contestant = Column(String, nullable=False)
-    ip_address = Column(String, nullable=True)
+    ip_address = Column(String, index=True, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     verified_via_captcha = Column(Boolean, default=False)
     verified_via_sms = Column(Boolean, default=False)
@@ -69,13 +83,51 @@ class IPChangeLog(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_db():
+    async with SessionLocal() as db:
+        try:
+            yield db
+        except Exception:
+            # Rejected requests (e.g. HTTPException) discard pending changes
+            await db.rollback()
+            raise
+
+
+# Arbitrary key for the advisory lock serialising table creation
+CREATE_TABLES_LOCK_KEY = 7310421
+
+
+async def create_tables():
+    """
+    Create missing tables on startup. Every worker runs this, so the
+    transaction-scoped advisory lock stops concurrent create_all calls
+    from racing on a fresh database.
+
+    create_all does not alter existing tables, so this refuses to start
+    against a votes table without uq_vote_fp_contestant: every
+    ON CONFLICT insert in main.record_vote would fail.
+    """
+    async with engine.begin() as conn:
+        await conn.execute(
+            text("SELECT pg_advisory_xact_lock(:key)"),
+            {"key": CREATE_TABLES_LOCK_KEY}
+        )
+        await conn.run_sync(Base.metadata.create_all)
+        has_constraint = await conn.scalar(text(
+            "SELECT 1 FROM pg_constraint WHERE conname = 'uq_vote_fp_contestant'"
+        ))
+
+    if not has_constraint:
+        raise RuntimeError(
+            "votes table is missing constraint uq_vote_fp_contestant; "
+            "run `python migrate_db.py` to upgrade the database"
+        )
 
 
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    """Create tables with a short-lived synchronous engine (used by init_db.py)"""
+    sync_engine = create_engine(settings.database_url)
+    try:
+        Base.metadata.create_all(bind=sync_engine)
+    finally:
+        sync_engine.dispose()
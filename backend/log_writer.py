@@ -0,0 +1,105 @@
+"""
+Background writer for audit log rows
+
+Log rows (e.g. RateLimitLog) are queued in memory and bulk-inserted by a
+background task, keeping commits for them off the request path.
+"""
+
+import asyncio
+import contextlib
+import logging
+from typing import Optional
+from sqlalchemy import insert
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = 0.1
+MAX_BATCH_SIZE = 500
+# Bounds memory under a flood of rejected requests; overflow rows are dropped
+MAX_QUEUED_ROWS = 10000
+
+log_queue: asyncio.Queue = asyncio.Queue(maxsize=MAX_QUEUED_ROWS)
+_flusher: Optional[asyncio.Task] = None
+dropped_rows = 0
+
+
+def enqueue_log(model, **values) -> None:
+    """Queue a row for `model` to be written by the background flusher"""
+    global dropped_rows
+    try:
+        log_queue.put_nowait((model, values))
+    except asyncio.QueueFull:
+        dropped_rows += 1
+        if dropped_rows % 1000 == 1:
+            logger.warning("Log queue full; %d rows dropped so far", dropped_rows)
+
+
+async def _write_batch(batch: list[tuple]) -> None:
+    """Bulk-insert queued rows, one executemany per table"""
+    rows_by_model: dict = {}
+    for model, values in batch:
+        rows_by_model.setdefault(model, []).append(values)
+
+    try:
+        async with SessionLocal() as db:
+            for model, rows in rows_by_model.items():
+                await db.execute(insert(model), rows)
+            await db.commit()
+    except Exception:
+        logger.exception("Log flush error (%d rows dropped)", len(batch))
+
+
+async def _write_batch_to_completion(batch: list[tuple]) -> None:
+    """Write a batch even if the flusher is cancelled mid-write"""
+    write = asyncio.ensure_future(_write_batch(batch))
+    try:
+        await asyncio.shield(write)
+    except asyncio.CancelledError:
+        await write
+        raise
+
+
+async def _flush_logs() -> None:
+    """Collect rows for up to FLUSH_INTERVAL_SECONDS, then write them together"""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await log_queue.get()]
+        deadline = loop.time() + FLUSH_INTERVAL_SECONDS
+        try:
+            while len(batch) < MAX_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(log_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            # Shutting down: don't lose rows already taken off the queue
+            await _write_batch(batch)
+            raise
+        await _write_batch_to_completion(batch)
+
+
+def start() -> None:
+    """Start the background flusher (call on application startup)"""
+    global _flusher
+    _flusher = asyncio.create_task(_flush_logs())
+
+
+async def stop() -> None:
+    """Stop the flusher and write any rows still queued (call on shutdown)"""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        # Let the flusher finish writing the batch it already holds
+        with contextlib.suppress(asyncio.CancelledError):
+            await _flusher
+        _flusher = None
+
+    batch = []
+    while not log_queue.empty():
+        batch.append(log_queue.get_nowait())
+    if batch:
+        await _write_batch(batch)
@@ -1,26 +1,78 @@
-from fastapi import FastAPI, Depends, HTTPException, Header, Request
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi.responses import ORJSONResponse
+from fastapi.exceptions import RequestValidationError
+from fastapi.exception_handlers import request_validation_exception_handler
+from sqlalchemy import select, update, func, true
+from sqlalchemy.exc import OperationalError, InterfaceError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from pydantic import BaseModel, BeforeValidator
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Literal, Annotated
+from functools import lru_cache
+from tenacity import (
+    retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+)
+import asyncio
 import hashlib
+import logging
 import secrets
+import sys
+import time
 
 
 from database import (
-    get_db, init_db, VoteSession, Vote, RateLimitLog, IPChangeLog
+    get_db, create_tables, engine, SessionLocal, VoteSession, Vote, RateLimitLog, IPChangeLog
+)
+from redis_client import (
+    check_rate_limit, cache_delete, cache_hset, seed_counter,
+    redis_pipeline, execute_pipeline, close as close_redis,
+    accept_vote, revert_vote,
+    VOTE_NO_SESSION, VOTE_DUPLICATE, VOTE_LIMIT_REACHED, VOTE_RATE_LIMITED
 )
-from redis_client import check_rate_limit, cache_set, cache_get
 from config import settings
 from captcha_service import captcha_service
+import log_writer
+
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="AGT Voting System", default_response_class=ORJSONResponse)
+
+# Per-IP vote counters are re-seeded from the database when they expire
+VOTE_COUNTER_TTL_SECONDS = 24 * 60 * 60
+
+# Window for the /vote rate limit and the recent-votes burst check
+VOTE_WINDOW_SECONDS = 60
+
+# Cached session hashes live as long as the token they validate
+SESSION_CACHE_TTL_SECONDS = settings.TOKEN_EXPIRY_MINUTES * 60
+
+
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    """
+    Keep the plain 400 message when the only problem is an unknown
+    contestant; everything else (missing fields, wrong types, other
+    errors in the same body) gets FastAPI's default 422 response.
+    """
+    errors = exc.errors()
+    if errors and all(
+        error["type"] == "literal_error" and error["loc"][-1:] == ("contestant",)
+        for error in errors
+    ):
+        return ORJSONResponse(
+            status_code=400,
+            content={"detail": settings.invalid_contestant_message}
+        )
+    return await request_validation_exception_handler(request, exc)
 
-app = FastAPI(title="AGT Voting System")
 
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=settings.ALLOWED_ORIGINS,  # React dev servers
+    allow_origins=settings.allowed_origins_list,  # React dev servers
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -42,8 +94,21 @@ class TokenResponse(BaseModel):
     is_suspicious: bool
 
 
+def normalize_contestant_name(name: str) -> str:
+    """Normalize contestant name for comparison"""
+    return name.strip().lower()
+
+
+# Validated by pydantic-core before the handler runs; non-strings are left
+# for the Literal check to reject
+ContestantName = Annotated[
+    Literal[tuple(sorted(settings.contestants_set))],
+    BeforeValidator(lambda v: normalize_contestant_name(v) if isinstance(v, str) else v)
+]
+
+
 class VoteRequest(BaseModel):
-    contestant: str
+    contestant: ContestantName
     fingerprint: str
     recaptcha_token: Optional[str] = None  # Required only if session is suspicious
 
@@ -63,7 +128,15 @@ def compute_fingerprint(visitor_id: str, local_id: str) -> str:
 
     Note: We use ONLY visitorId (not localId) to ensure the fingerprint
     persists even if user clears localStorage. This prevents vote limit bypass.
+
+    Stored sessions and votes are keyed by this digest and the raw visitorId
+    is never kept, so the hash function cannot change without wiping them.
     """
+    return _hash_visitor_id(visitor_id)
+
+
+@lru_cache(maxsize=4096)
+def _hash_visitor_id(visitor_id: str) -> str:
     return hashlib.sha256(visitor_id.encode()).hexdigest()
 
 
@@ -72,11 +145,6 @@ def generate_token() -> str:
     return secrets.token_hex(16)
 
 
-def normalize_contestant_name(name: str) -> str:
-    """Normalize contestant name for comparison"""
-    return name.strip().lower()
-
-
 def get_client_ip(request: Request) -> str:
     """Extract client IP address from request"""
     forwarded = request.headers.get("X-Forwarded-For")
@@ -85,11 +153,309 @@ def get_client_ip(request: Request) -> str:
     return request.client.host if request.client else "unknown"
 
 
+def session_cache_key(fingerprint: str) -> str:
+    return f"session:{fingerprint}"
+
+
+def ip_votes_key(ip: str) -> str:
+    return f"votes:ip:{ip}"
+
+
+def recent_votes_key(fingerprint: str) -> str:
+    return f"votes:fp:{fingerprint}"
+
+
+def vote_rate_limit_key(ip: str) -> str:
+    return f"rate_limit:vote:{ip}"
+
+
+# Fields every complete session hash has (see session_cache_mapping)
+SESSION_CACHE_FIELDS = ("id", "token", "exp", "suspicious", "votes_used", "ip")
+
+
+def is_cached_session(cached: Optional[dict]) -> bool:
+    """True for a complete session hash; partial or missing hashes are a cache miss"""
+    return bool(cached) and all(field in cached for field in SESSION_CACHE_FIELDS)
+
+
+def session_cache_mapping(session: VoteSession, contestants: list[str]) -> dict:
+    """
+    Snapshot the fields needed to validate and accept a vote.
+    Contestants already voted for are stored as `c:{name}` fields.
+    """
+    mapping = {
+        "id": session.id,
+        "token": session.token,
+        "exp": session.token_expires_at.isoformat(),
+        "suspicious": int(bool(session.is_suspicious)),
+        "votes_used": session.votes_used,
+        "ip": session.ip_address or "",
+    }
+    mapping.update({f"c:{name}": 1 for name in contestants})
+    return mapping
+
+
+async def cache_session(fingerprint: str, mapping: dict) -> None:
+    """Mirror session token state into Redis for fast validation on /vote"""
+    await cache_hset(
+        session_cache_key(fingerprint),
+        mapping,
+        SESSION_CACHE_TTL_SECONDS
+    )
+
+
+async def voted_contestants(db: AsyncSession, fingerprint: str) -> list[str]:
+    result = await db.execute(
+        select(Vote.contestant).where(Vote.fingerprint == fingerprint)
+    )
+    return list(result.scalars().all())
+
+
+async def load_session(
+    db: AsyncSession,
+    fingerprint: str,
+    cached: Optional[dict]
+) -> Optional[VoteSession]:
+    """
+    Load the session for a fingerprint, preferring the Redis copy
+    (`cached`: the `session:{fingerprint}` hash, or None on a miss; an
+    incomplete hash is treated as a miss and rewritten).
+
+    A cached session is attached to `db` as a detached instance, so any
+    later changes are flushed as a plain UPDATE without a prior SELECT.
+    The database remains the source of truth: the cache entry expires with
+    the token and is dropped whenever the suspicious flag changes.
+    """
+    if is_cached_session(cached):
+        session = VoteSession(
+            id=int(cached["id"]),
+            fingerprint=fingerprint,
+            token=cached["token"],
+            token_expires_at=datetime.fromisoformat(cached["exp"]),
+            is_suspicious=cached["suspicious"] == "1",
+            votes_used=int(cached["votes_used"]),
+            ip_address=cached["ip"] or None
+        )
+        make_transient_to_detached(session)
+        db.add(session)
+        return session
+
+    result = await db.execute(
+        select(VoteSession).where(VoteSession.fingerprint == fingerprint)
+    )
+    session = result.scalar_one_or_none()
+    if session:
+        contestants = await voted_contestants(db, fingerprint)
+        await cache_session(fingerprint, session_cache_mapping(session, contestants))
+    return session
+
+
+async def count_votes_from_ip(db: AsyncSession, ip: str, cached: Optional[str]) -> int:
+    """
+    Count total votes cast from an IP address.
+
+    `cached` is the `votes:ip:{ip}` Redis counter as read by the caller's
+    pipeline; falls back to the database (and re-seeds the counter) when
+    the key is missing or Redis is unavailable.
+    """
+    if cached is not None:
+        return int(cached)
+    count = await db.scalar(
+        select(func.count(Vote.id)).where(Vote.ip_address == ip)
+    )
+    await seed_counter(ip_votes_key(ip), count, VOTE_COUNTER_TTL_SECONDS)
+    return count
+
+
+async def has_voted_for(
+    db: AsyncSession,
+    fingerprint: str,
+    contestant: str,
+    cached: Optional[dict]
+) -> bool:
+    """
+    Check whether this fingerprint already voted for `contestant`, using
+    the `c:{contestant}` field of the cached session hash when there is one.
+    """
+    if is_cached_session(cached):
+        return f"c:{contestant}" in cached
+    vote_id = await db.scalar(
+        select(Vote.id).where(
+            Vote.fingerprint == fingerprint,
+            Vote.contestant == contestant
+        ).limit(1)
+    )
+    return vote_id is not None
+
+
+async def count_recent_votes(
+    db: AsyncSession,
+    fingerprint: str,
+    cached: Optional[int]
+) -> int:
+    """
+    Count votes recorded from this fingerprint in the last minute.
+
+    `cached` is the size of the `votes:fp:{fingerprint}` sorted-set rolling
+    window (entries are added only once a vote is accepted) as read by the
+    caller's pipeline; falls back to the database if Redis is unavailable.
+    """
+    if cached is not None:
+        return int(cached)
+    return await db.scalar(
+        select(func.count(Vote.id)).where(
+            Vote.fingerprint == fingerprint,
+            Vote.created_at > datetime.utcnow() - timedelta(minutes=1)
+        )
+    )
+
+
+def duplicate_vote_error(contestant: str) -> HTTPException:
+    return HTTPException(
+        status_code=400,
+        detail=f"You have already voted for {contestant.capitalize()}."
+    )
+
+
+def vote_limit_error() -> HTTPException:
+    return HTTPException(
+        status_code=403,
+        detail=f"Maximum votes ({settings.MAX_VOTES_PER_DEVICE}) reached for this device."
+    )
+
+
+async def record_vote(db: AsyncSession, session_id: int, vote: dict) -> int:
+    """
+    Insert a vote and increment the session's votes_used in the current
+    transaction; the caller commits. Returns the new votes_used.
+
+    The (fingerprint, contestant) unique constraint rejects duplicates and
+    the guarded UPDATE stops concurrent requests from exceeding the device
+    limit. On rejection the transaction is rolled back and an
+    HTTPException is raised.
+    """
+    stmt = pg_insert(Vote).values(**vote).on_conflict_do_nothing(
+        index_elements=["fingerprint", "contestant"]
+    ).returning(Vote.id)
+
+    if (await db.execute(stmt)).first() is None:
+        await db.rollback()
+        raise duplicate_vote_error(vote["contestant"])
+
+    result = await db.execute(
+        update(VoteSession)
+        .where(
+            VoteSession.id == session_id,
+            VoteSession.votes_used < settings.MAX_VOTES_PER_DEVICE
+        )
+        .values(
+            votes_used=VoteSession.votes_used + 1,
+            updated_at=datetime.utcnow()
+        )
+        .returning(VoteSession.votes_used)
+        .execution_options(synchronize_session=False)
+    )
+    votes_used = result.scalar_one_or_none()
+
+    if votes_used is None:
+        await db.rollback()  # Discard the vote inserted above
+        raise vote_limit_error()
+
+    return votes_used
+
+
+async def rate_limited_response(
+    db: AsyncSession,
+    session: VoteSession,
+    ip: str
+) -> VoteResponse:
+    """Flag the session after a /vote rate-limit hit and tell the client"""
+    # Mark session as suspicious
+    session.is_suspicious = True
+    await db.commit()
+    await cache_delete(session_cache_key(session.fingerprint))
+
+    # Log rate limit violation
+    log_writer.enqueue_log(
+        RateLimitLog,
+        ip_address=ip,
+        fingerprint=session.fingerprint,
+        endpoint="/vote"
+    )
+
+    # In a real system, this would trigger CAPTCHA or SMS verification
+    return VoteResponse(
+        success=False,
+        message="Suspicious activity detected. Additional verification required.",
+        requires_verification=True
+    )
+
+
+# Connection-level failures worth retrying; constraint rejections are not
+TRANSIENT_DB_ERRORS = (OperationalError, InterfaceError, OSError, asyncio.TimeoutError)
+
+
+@retry(
+    stop=stop_after_attempt(4),
+    wait=wait_exponential(multiplier=0.2, max=2.0),
+    retry=retry_if_exception_type(TRANSIENT_DB_ERRORS),
+    reraise=True
+)
+async def _write_vote(session_id: int, vote: dict) -> None:
+    async with SessionLocal() as db:
+        await record_vote(db, session_id, vote)
+        await db.commit()
+
+
+async def persist_vote(session_id: int, vote: dict) -> None:
+    """
+    Background task: write a vote already accepted in Redis to Postgres.
+
+    Transient database errors are retried with backoff. Database
+    constraints still apply, so a vote accepted against stale cache state
+    is rejected here rather than double-counted. If the vote cannot be
+    stored, its Redis state (`c:{contestant}`, votes_used and the IP
+    counter) is rolled back so the device can vote again.
+    """
+    fingerprint = vote["fingerprint"]
+    try:
+        await _write_vote(session_id, vote)
+        return
+    except HTTPException as e:
+        logger.warning("Vote for %s by %s rejected on persist: %s",
+                       vote["contestant"], fingerprint, e.detail)
+        # A duplicate means the database already holds this contestant
+        forget_contestant = e.status_code != 400
+    except Exception:
+        logger.exception("Failed to persist vote for %s by %s",
+                         vote["contestant"], fingerprint)
+        forget_contestant = True
+
+    if not await revert_vote(
+        session_cache_key(fingerprint),
+        ip_votes_key(vote["ip_address"]),
+        vote["contestant"],
+        forget_contestant
+    ):
+        logger.error("Could not roll back Redis state for %s", fingerprint)
+
+
 # Endpoints
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database on startup"""
-    init_db()
+    """Initialize database and background workers on startup"""
+    await create_tables()
+    captcha_service.start()
+    log_writer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background workers and release shared connections on shutdown"""
+    await captcha_service.close()
+    await log_writer.stop()
+    await engine.dispose()
+    await close_redis()
 
 
 @app.get("/")
@@ -103,7 +469,7 @@ async def get_token(
     visitorId: str,
     localId: str,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Issue a short-lived token bound to a persistent device fingerprint.
@@ -118,24 +484,26 @@ async def get_token(
     # Rate limiting for token endpoint
     ip = get_client_ip(request)
     rate_limit_key = f"rate_limit:token:{ip}"
-    is_allowed, count = check_rate_limit(rate_limit_key, 10, 60)  # 10 requests per minute
+    is_allowed, count = await check_rate_limit(rate_limit_key, 10, 60)  # 10 requests per minute
 
     if not is_allowed:
         # Log rate limit violation
-        log = RateLimitLog(
+        log_writer.enqueue_log(
+            RateLimitLog,
             ip_address=ip,
             fingerprint="N/A",
             endpoint="/token"
         )
-        db.add(log)
-        db.commit()
         raise HTTPException(status_code=429, detail="Too many token requests. Please try again later.")
 
     # Compute server-side fingerprint
     fingerprint = compute_fingerprint(visitorId, localId)
 
     # Look up existing session
-    session = db.query(VoteSession).filter(VoteSession.fingerprint == fingerprint).first()
+    result = await db.execute(
+        select(VoteSession).where(VoteSession.fingerprint == fingerprint)
+    )
+    session = result.scalar_one_or_none()
 
     # Check for IP changes when refreshing token (e.g., after network switch)
     if session and session.ip_address and session.ip_address != ip:
@@ -165,17 +533,25 @@ async def get_token(
             token=token,
             token_expires_at=expires_at,
             votes_used=0,
-            ip_address=ip
+            ip_address=ip,
+            is_suspicious=False
         )
         db.add(session)
 
-    db.commit()
+    await db.commit()
 
-    # Cache token in Redis for fast lookup
-    cache_set(f"token:{fingerprint}", token, settings.TOKEN_EXPIRY_MINUTES * 60)
+    # Cache session in Redis for fast token validation on /vote and read
+    # the IP vote counter in the same round trip
+    contestants = await voted_contestants(db, fingerprint) if session.votes_used else []
+    session_key = session_cache_key(fingerprint)
+    async with redis_pipeline() as pipe:
+        pipe.hset(session_key, mapping=session_cache_mapping(session, contestants))
+        pipe.expire(session_key, SESSION_CACHE_TTL_SECONDS)
+        pipe.get(ip_votes_key(ip))
+        results = await execute_pipeline(pipe)
 
     # Count total votes from this IP (across all browsers)
-    votes_from_ip = db.query(Vote).filter(Vote.ip_address == ip).count()
+    votes_from_ip = await count_votes_from_ip(db, ip, results[2] if results else None)
 
     return TokenResponse(
         token=token,
@@ -191,27 +567,50 @@ async def get_token(
 async def submit_vote(
     vote_request: VoteRequest,
     request: Request,
+    background: BackgroundTasks,
     x_vote_token: str = Header(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Validate and record a vote.
 
     Validation steps:
     1. Verify token exists, is valid, and maps to fingerprint
-    2. Normalize and validate contestant name
-    3. Check for duplicate vote per contestant
+    2. Normalize and validate contestant name (done by VoteRequest)
+    3. Reject duplicate votes per contestant
     4. Enforce maximum votes per device (3)
     5. Apply IP-based rate limiting
     6. Flag suspicious patterns
+
+    Accepted votes are counted atomically in the Redis session hash and
+    written to Postgres by a background task after the response is sent.
+    If Redis is unavailable the vote is written synchronously instead.
     """
 
     ip = get_client_ip(request)
     fingerprint = vote_request.fingerprint
-    contestant = normalize_contestant_name(vote_request.contestant)
+    contestant = vote_request.contestant  # Normalized and validated by VoteRequest
+
+    now = time.time()
+    rate_limit_key = vote_rate_limit_key(ip)
+    window_key = recent_votes_key(fingerprint)
+
+    # Fetch the cached session, counters and recent-votes window in one
+    # round trip; the vote itself is accepted in a second one
+    async with redis_pipeline() as pipe:
+        pipe.hgetall(session_cache_key(fingerprint))
+        pipe.get(ip_votes_key(ip))
+        pipe.get(rate_limit_key)
+        pipe.zremrangebyscore(window_key, 0, now - VOTE_WINDOW_SECONDS)
+        pipe.zcard(window_key)
+        results = await execute_pipeline(pipe)
+    if results:
+        cached_session, cached_ip_votes, cached_rate_count, _, cached_recent_votes = results
+    else:
+        cached_session = cached_ip_votes = cached_rate_count = cached_recent_votes = None
 
-    # Step 1: Verify token
-    session = db.query(VoteSession).filter(VoteSession.fingerprint == fingerprint).first()
+    # Step 1: Verify token (served from Redis when cached)
+    session = await load_session(db, fingerprint, cached_session or None)
 
     if not session:
         raise HTTPException(status_code=401, detail="Invalid session. Please refresh your token.")
@@ -222,23 +621,37 @@ async def submit_vote(
     if session.token_expires_at < datetime.utcnow():
         raise HTTPException(status_code=401, detail="Token expired. Please refresh your token.")
 
+    # Step 3: Reject duplicate votes before any check below spends rate-limit
+    # quota or flags the session (accept_vote/record_vote re-check atomically)
+    if await has_voted_for(db, fingerprint, contestant, cached_session):
+        raise duplicate_vote_error(contestant)
+
+    # Burst-detection changes below are committed once, at the end of the
+    # request; if the vote is rejected they roll back and the check runs
+    # again on the next attempt. The IP change is the exception, see below.
+    session_changed = False
+
     # Step 1.3: Check for IP changes BEFORE processing vote (detect suspicious activity early)
     if session.ip_address and session.ip_address != ip:
         # IP has changed for this fingerprint! Possible VPN switch
         # Mark as suspicious and require CAPTCHA (don't block, just require verification)
 
         # Log the IP change
-        ip_change_log = IPChangeLog(
+        log_writer.enqueue_log(
+            IPChangeLog,
             fingerprint=fingerprint,
             old_ip=session.ip_address,
             new_ip=ip
         )
-        db.add(ip_change_log)
 
-        # Mark session as suspicious and require CAPTCHA verification
+        # Mark session as suspicious and require CAPTCHA verification.
+        # Committed right away (rare path): the flag must survive a rejected
+        # or abandoned CAPTCHA challenge, and storing the new IP stops
+        # retries from logging the same change again.
         session.is_suspicious = True
         session.ip_address = ip  # Update to new IP
-        db.commit()
+        await db.commit()
+        await cache_delete(session_cache_key(fingerprint))
 
     # Step 1.5: Check if session is suspicious - require CAPTCHA verification
     if session.is_suspicious:
@@ -250,7 +663,7 @@ async def submit_vote(
             )
         
         # Verify reCAPTCHA with client IP
-        is_valid = captcha_service.verify_response(
+        is_valid = await captcha_service.verify_response(
             recaptcha_token=vote_request.recaptcha_token,
             remote_ip=ip
         )
@@ -261,107 +674,104 @@ async def submit_vote(
                 detail="Invalid CAPTCHA response. Please try again."
             )
 
-    # Step 2: Normalize and validate contestant name
-    if contestant not in settings.allowed_contestants_list:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid contestant name. Allowed contestants: {', '.join(settings.allowed_contestants_list)}"
-        )
-
-    # Step 3: Check for duplicate vote for this contestant
-    existing_vote = db.query(Vote).filter(
-        Vote.fingerprint == fingerprint,
-        Vote.contestant == contestant
-    ).first()
-
-    if existing_vote:
-        raise HTTPException(
-            status_code=400,
-            detail=f"You have already voted for {contestant.capitalize()}."
-        )
-
     # Step 4: Enforce maximum votes per device
     if session.votes_used >= settings.MAX_VOTES_PER_DEVICE:
-        raise HTTPException(
-            status_code=403,
-            detail=f"Maximum votes ({settings.MAX_VOTES_PER_DEVICE}) reached for this device."
-        )
+        raise vote_limit_error()
 
     # Step 4.5: Enforce maximum votes per IP (across all browsers/devices)
-    total_votes_from_ip = db.query(Vote).filter(
-        Vote.ip_address == ip
-    ).count()
+    total_votes_from_ip = await count_votes_from_ip(db, ip, cached_ip_votes)
 
     if total_votes_from_ip >= settings.MAX_VOTES_PER_IP:
         # Mark all sessions from this IP as suspicious
-        sessions_from_ip = db.query(VoteSession).filter(
-            VoteSession.ip_address == ip
-        ).all()
+        result = await db.execute(
+            select(VoteSession).where(VoteSession.ip_address == ip)
+        )
+        sessions_from_ip = result.scalars().all()
         for s in sessions_from_ip:
             s.is_suspicious = True
-        db.commit()
+        await db.commit()
+        for s in sessions_from_ip:
+            await cache_delete(session_cache_key(s.fingerprint))
 
         raise HTTPException(
             status_code=403,
             detail=f"Maximum votes ({settings.MAX_VOTES_PER_IP}) reached from your location. You cannot vote from multiple browsers."
         )
 
-    # Step 5: IP-based rate limiting
-    rate_limit_key = f"rate_limit:vote:{ip}"
-    is_allowed, count = check_rate_limit(
-        rate_limit_key,
-        settings.RATE_LIMIT_VOTES_PER_MINUTE,
-        60
-    )
-
-    if not is_allowed:
-        # Mark session as suspicious
-        session.is_suspicious = True
-        db.commit()
-
-        # Log rate limit violation
-        log = RateLimitLog(
-            ip_address=ip,
-            fingerprint=fingerprint,
-            endpoint="/vote"
-        )
-        db.add(log)
-        db.commit()
-
-        # In a real system, this would trigger CAPTCHA or SMS verification
-        return VoteResponse(
-            success=False,
-            message="Suspicious activity detected. Additional verification required.",
-            requires_verification=True
-        )
+    # Step 5: IP-based rate limiting. Checked against the counter read
+    # above; accept_vote re-checks and increments it atomically
+    if int(cached_rate_count or 0) >= settings.RATE_LIMIT_VOTES_PER_MINUTE:
+        return await rate_limited_response(db, session, ip)
 
     # Step 6: Check for suspicious patterns (multiple votes in short time)
-    recent_votes = db.query(Vote).filter(
-        Vote.fingerprint == fingerprint,
-        Vote.created_at > datetime.utcnow() - timedelta(minutes=1)
-    ).count()
+    recent_votes = await count_recent_votes(db, fingerprint, cached_recent_votes)
 
     if recent_votes >= 2:
         session.is_suspicious = True
-        db.commit()
+        session_changed = True
+
+    vote = {
+        "fingerprint": fingerprint,
+        "contestant": contestant,
+        "ip_address": ip,
+        "created_at": datetime.utcnow(),
+        "verified_via_captcha": session.is_suspicious,  # True if CAPTCHA was required and verified
+        "verified_via_sms": False
+    }
 
-    # Record the vote
-    vote = Vote(
-        fingerprint=fingerprint,
-        contestant=contestant,
-        ip_address=ip,
-        verified_via_captcha=session.is_suspicious,  # True if CAPTCHA was required and verified
-        verified_via_sms=False
+    # Record: accept the vote atomically in the Redis session hash (duplicate,
+    # device-limit and rate-limit checks repeated there to close races,
+    # counters and the burst flag updated in the same call), then persist
+    # it to Postgres after the response is sent
+    votes_used = await accept_vote(
+        session_cache_key(fingerprint),
+        contestant,
+        settings.MAX_VOTES_PER_DEVICE,
+        rate_limit_key,
+        settings.RATE_LIMIT_VOTES_PER_MINUTE,
+        VOTE_WINDOW_SECONDS,
+        ip_votes_key(ip),
+        VOTE_COUNTER_TTL_SECONDS,
+        window_key,
+        now,
+        VOTE_WINDOW_SECONDS,
+        flag_suspicious=session_changed
     )
-    db.add(vote)
-
-    # Update session vote count
-    session.votes_used += 1
-    session.updated_at = datetime.utcnow()
 
-    db.commit()
+    if votes_used == VOTE_DUPLICATE:
+        raise duplicate_vote_error(contestant)
+    if votes_used == VOTE_LIMIT_REACHED:
+        raise vote_limit_error()
+    if votes_used == VOTE_RATE_LIMITED:
+        return await rate_limited_response(db, session, ip)
+
+    if votes_used is None or votes_used == VOTE_NO_SESSION:
+        # Redis unavailable or session not cached: check the rate limit and
+        # write synchronously
+        is_allowed, _ = await check_rate_limit(
+            rate_limit_key,
+            settings.RATE_LIMIT_VOTES_PER_MINUTE,
+            VOTE_WINDOW_SECONDS
+        )
+        if not is_allowed:
+            return await rate_limited_response(db, session, ip)
+
+        votes_used = await record_vote(db, session.id, vote)
+        await db.commit()
+
+        ip_key = ip_votes_key(ip)
+        async with redis_pipeline() as pipe:
+            pipe.delete(session_cache_key(fingerprint))
+            pipe.incr(ip_key)
+            pipe.expire(ip_key, VOTE_COUNTER_TTL_SECONDS)
+            pipe.zadd(window_key, {str(now): now})
+            pipe.expire(window_key, VOTE_WINDOW_SECONDS * 2)
+            await execute_pipeline(pipe)
+    else:
+        await db.commit()
+        background.add_task(persist_vote, session.id, vote)
 
-    votes_remaining = settings.MAX_VOTES_PER_DEVICE - session.votes_used
+    votes_remaining = settings.MAX_VOTES_PER_DEVICE - votes_used
 
     return VoteResponse(
         success=True,
@@ -384,27 +794,50 @@ async def get_captcha_site_key():
 
 
 @app.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
+async def get_stats(db: AsyncSession = Depends(get_db)):
     """Get voting statistics (for admin/demo purposes)"""
-    total_votes = db.query(Vote).count()
-    total_sessions = db.query(VoteSession).count()
-    suspicious_sessions = db.query(VoteSession).filter(VoteSession.is_suspicious == True).count()
-
-    # Vote counts by contestant
-    from sqlalchemy import func
-    contestant_votes = db.query(
+    # One round trip: session totals joined to per-contestant vote counts.
+    # The LEFT JOIN keeps a single row (contestant NULL) when there are no votes.
+    by_contestant = select(
         Vote.contestant,
-        func.count(Vote.id).label("count")
-    ).group_by(Vote.contestant).all()
+        func.count(Vote.id).label("votes")
+    ).group_by(Vote.contestant).cte("by_contestant")
+    sessions = select(
+        func.count(VoteSession.id).label("total"),
+        func.count(VoteSession.id).filter(VoteSession.is_suspicious == True).label("suspicious")
+    ).cte("sessions")
+
+    rows = (await db.execute(
+        select(
+            sessions.c.total,
+            sessions.c.suspicious,
+            by_contestant.c.contestant,
+            by_contestant.c.votes
+        ).select_from(sessions.outerjoin(by_contestant, true()))
+    )).all()
+
+    contestant_votes = dict(
+        (row.contestant, row.votes) for row in rows if row.contestant is not None
+    )
 
     return {
-        "total_votes": total_votes,
-        "total_sessions": total_sessions,
-        "suspicious_sessions": suspicious_sessions,
-        "votes_by_contestant": {name: count for name, count in contestant_votes}
+        "total_votes": sum(contestant_votes.values()),
+        "total_sessions": rows[0].total,
+        "suspicious_sessions": rows[0].suspicious,
+        "votes_by_contestant": contestant_votes
     }
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop and httptools ship with uvicorn[standard] but not on Windows
+    fast_io = sys.platform != "win32"
+    # Workers need an import string; each one gets its own DB pool
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop" if fast_io else "auto",
+        http="httptools" if fast_io else "auto",
+        workers=settings.web_workers
+    )
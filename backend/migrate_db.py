@@ -0,0 +1,55 @@
+"""
+Database migration script
+
+create_all only creates missing tables, so databases created before the
+votes unique constraint and indexes existed need this once:
+    python migrate_db.py
+
+Safe to re-run. Duplicate (fingerprint, contestant) votes that slipped in
+before the constraint existed are removed first, keeping the earliest one.
+"""
+
+from sqlalchemy import create_engine, text
+from config import settings
+
+MIGRATIONS = [
+    # One vote per contestant per device (ON CONFLICT in main.record_vote)
+    """
+    DELETE FROM votes a USING votes b
+    WHERE a.fingerprint = b.fingerprint
+      AND a.contestant = b.contestant
+      AND a.id > b.id
+    """,
+    """
+    DO $$ BEGIN
+        IF NOT EXISTS (
+            SELECT 1 FROM pg_constraint WHERE conname = 'uq_vote_fp_contestant'
+        ) THEN
+            ALTER TABLE votes
+                ADD CONSTRAINT uq_vote_fp_contestant UNIQUE (fingerprint, contestant);
+        END IF;
+    END $$
+    """,
+    # Indexes for the recent-votes and per-IP counts
+    "CREATE INDEX IF NOT EXISTS ix_vote_fp_created ON votes (fingerprint, created_at)",
+    "CREATE INDEX IF NOT EXISTS ix_votes_ip_address ON votes (ip_address)",
+    # Covered by the two indexes above, both leading with fingerprint
+    "DROP INDEX IF EXISTS ix_votes_fingerprint",
+    "ANALYZE votes",
+]
+
+
+def migrate_db():
+    sync_engine = create_engine(settings.database_url)
+    try:
+        with sync_engine.begin() as conn:
+            for statement in MIGRATIONS:
+                conn.execute(text(statement))
+    finally:
+        sync_engine.dispose()
+
+
+if __name__ == "__main__":
+    print("Migrating database...")
+    migrate_db()
+    print("Database migrated successfully!")
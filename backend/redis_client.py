@@ -1,58 +1,202 @@
 import redis
+import redis.asyncio
 from config import settings
 from typing import Optional
 
-redis_client = redis.Redis(
+# One explicit pool per worker process, shared by every request. The
+# blocking pool makes callers wait for a free connection when all 64 are
+# busy, instead of raising ConnectionError (which helpers treat as Redis
+# being down).
+redis_pool = redis.asyncio.BlockingConnectionPool(
     host=settings.REDIS_HOST,
     port=settings.REDIS_PORT,
     db=settings.REDIS_DB,
-    decode_responses=True
+    decode_responses=True,
+    max_connections=64,
+    timeout=2,  # seconds to wait for a free connection
+    socket_keepalive=True
 )
 
+redis_client = redis.asyncio.Redis(connection_pool=redis_pool)
 
-def check_rate_limit(key: str, limit: int, window_seconds: int) -> tuple[bool, int]:
+
+# Fixed-window counter: INCR and set the expiry on the first hit, atomically
+_rate_limit_script = redis_client.register_script(
+    "local c = redis.call('INCR', KEYS[1]) "
+    "if c == 1 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end "
+    "return c"
+)
+
+
+# Vote acceptance against the cached session hash (see main.load_session).
+# Voted contestants are stored as `c:{name}` fields next to `votes_used`.
+# An accepted vote also bumps the rate-limit and per-IP counters and the
+# rolling window in the same call, and optionally flags the session
+# suspicious; nothing is written if the hash is gone.
+VOTE_NO_SESSION = -1
+VOTE_DUPLICATE = -2
+VOTE_LIMIT_REACHED = -3
+VOTE_RATE_LIMITED = -4
+
+_accept_vote_script = redis_client.register_script(
+    "local used = redis.call('HGET', KEYS[1], 'votes_used') "
+    "if not used then return -1 end "
+    "if redis.call('HEXISTS', KEYS[1], 'c:' .. ARGV[1]) == 1 then return -2 end "
+    "if tonumber(used) >= tonumber(ARGV[2]) then return -3 end "
+    "if tonumber(redis.call('GET', KEYS[2]) or '0') >= tonumber(ARGV[3]) then return -4 end "
+    "if redis.call('INCR', KEYS[2]) == 1 then redis.call('EXPIRE', KEYS[2], ARGV[4]) end "
+    "redis.call('INCR', KEYS[3]) "
+    "redis.call('EXPIRE', KEYS[3], ARGV[5]) "
+    "redis.call('ZADD', KEYS[4], ARGV[6], ARGV[6]) "
+    "redis.call('EXPIRE', KEYS[4], tonumber(ARGV[7]) * 2) "
+    "if ARGV[8] == '1' then redis.call('HSET', KEYS[1], 'suspicious', 1) end "
+    "redis.call('HSET', KEYS[1], 'c:' .. ARGV[1], 1) "
+    "return redis.call('HINCRBY', KEYS[1], 'votes_used', 1)"
+)
+
+
+# Undo a vote accepted by _accept_vote_script whose database write failed.
+# ARGV[2] == '1' also forgets the contestant (unset when the DB already
+# holds a vote for it). Counters are only touched if their keys still exist.
+_revert_vote_script = redis_client.register_script(
+    "if redis.call('EXISTS', KEYS[1]) == 1 then "
+    "  if ARGV[2] == '1' then redis.call('HDEL', KEYS[1], 'c:' .. ARGV[1]) end "
+    "  redis.call('HINCRBY', KEYS[1], 'votes_used', -1) "
+    "end "
+    "if redis.call('EXISTS', KEYS[2]) == 1 then redis.call('DECR', KEYS[2]) end "
+    "return 1"
+)
+
+
+def redis_pipeline() -> redis.asyncio.client.Pipeline:
     """
-    Check if rate limit is exceeded using Redis sliding window.
-    Returns (is_allowed, current_count)
+    Non-transactional pipeline for batching independent commands into a
+    single round trip. Use as `async with redis_pipeline() as pipe:` and
+    run the queued commands with `execute_pipeline(pipe)`.
     """
+    return redis_client.pipeline(transaction=False)
+
+
+async def execute_pipeline(pipe: redis.asyncio.client.Pipeline) -> Optional[list]:
+    """Execute a pipeline; returns its results, or None if Redis is unavailable"""
     try:
-        current = redis_client.get(key)
-        if current is None:
-            redis_client.setex(key, window_seconds, 1)
-            return True, 1
+        return await pipe.execute()
+    except redis.ConnectionError:
+        return None
+
+
+async def close() -> None:
+    """Disconnect pooled connections (call on application shutdown)"""
+    await redis_pool.disconnect()
 
-        count = int(current)
-        if count >= limit:
-            return False, count
 
-        redis_client.incr(key)
-        return True, count + 1
+async def check_rate_limit(key: str, limit: int, window_seconds: int) -> tuple[bool, int]:
+    """
+    Check if rate limit is exceeded using an atomic Redis counter.
+    The increment and expiry run as a single Lua script (one round trip),
+    so concurrent requests cannot slip past the limit.
+    Returns (is_allowed, current_count)
+    """
+    try:
+        count = int(await _rate_limit_script(keys=[key], args=[window_seconds]))
+        return count <= limit, count
     except redis.ConnectionError:
         # If Redis is down, allow the request but log it
         return True, 0
 
 
-def cache_set(key: str, value: str, expiry_seconds: int) -> bool:
+async def seed_counter(key: str, value: int, ttl: int) -> bool:
+    """Initialise a counter only if it does not exist yet"""
+    try:
+        await redis_client.set(key, value, ex=ttl, nx=True)
+        return True
+    except redis.ConnectionError:
+        return False
+
+
+async def cache_set(key: str, value: str, expiry_seconds: int) -> bool:
     """Set a value in Redis cache with expiry"""
     try:
-        redis_client.setex(key, expiry_seconds, value)
+        await redis_client.setex(key, expiry_seconds, value)
         return True
     except redis.ConnectionError:
         return False
 
 
-def cache_get(key: str) -> Optional[str]:
+async def cache_get(key: str) -> Optional[str]:
     """Get a value from Redis cache"""
     try:
-        return redis_client.get(key)
+        return await redis_client.get(key)
     except redis.ConnectionError:
         return None
 
 
-def cache_delete(key: str) -> bool:
+async def cache_delete(key: str) -> bool:
     """Delete a key from Redis cache"""
     try:
-        redis_client.delete(key)
+        await redis_client.delete(key)
+        return True
+    except redis.ConnectionError:
+        return False
+
+
+async def cache_hset(key: str, mapping: dict, expiry_seconds: int) -> bool:
+    """Store a hash in Redis cache with expiry"""
+    try:
+        async with redis_client.pipeline() as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, expiry_seconds)
+            await pipe.execute()
+        return True
+    except redis.ConnectionError:
+        return False
+
+
+async def accept_vote(
+    session_key: str,
+    contestant: str,
+    max_votes: int,
+    rate_key: str,
+    rate_limit: int,
+    rate_window: int,
+    ip_key: str,
+    ip_ttl: int,
+    window_key: str,
+    ts: float,
+    window: int,
+    flag_suspicious: bool = False
+) -> Optional[int]:
+    """
+    Atomically record a vote for `contestant` in a cached session hash,
+    counting it against the `rate_key` fixed window, the `ip_key` counter
+    and the `window_key` rolling window in the same round trip.
+    Returns the new votes_used, one of the VOTE_* codes if rejected,
+    or None if Redis is unavailable.
+    """
+    try:
+        return int(await _accept_vote_script(
+            keys=[session_key, rate_key, ip_key, window_key],
+            args=[
+                contestant, max_votes, rate_limit, rate_window,
+                ip_ttl, ts, window, "1" if flag_suspicious else "0"
+            ]
+        ))
+    except redis.ConnectionError:
+        return None
+
+
+async def revert_vote(
+    session_key: str,
+    ip_key: str,
+    contestant: str,
+    forget_contestant: bool = True
+) -> bool:
+    """Roll back the Redis state of a vote accepted by accept_vote"""
+    try:
+        await _revert_vote_script(
+            keys=[session_key, ip_key],
+            args=[contestant, "1" if forget_contestant else "0"]
+        )
         return True
     except redis.ConnectionError:
         return False